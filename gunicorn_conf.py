@@ -0,0 +1,18 @@
+# gunicorn_conf.py
+import os
+
+# gevent workers let concurrent alerts overlap their Kraken round-trips instead of
+# queueing behind one blocking call; gunicorn monkey-patches before loading webhook.py
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = "gevent"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+if float(os.getenv("RATE_LIMIT_SECONDS", "0")) > 0:
+    # webhook.py's rate limit lives in process memory; one worker keeps it global
+    workers = 1
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", 100))
+
+def post_worker_init(worker):
+    # warm the Kraken client in the background so the worker answers /health right away
+    import threading
+    import webhook
+    threading.Thread(target=webhook.warm_kraken, daemon=True).start()
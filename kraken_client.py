@@ -0,0 +1,71 @@
+# kraken_client.py
+# Imported lazily by webhook.get_kraken() so /health can answer before krakenex/requests load.
+import hmac
+import time
+import base64
+import hashlib
+import threading
+import urllib.parse
+from requests.adapters import HTTPAdapter
+import krakenex
+
+# Kraken wants nonces increasing per API key, and every gunicorn worker signs with the
+# same key. Track wall-clock milliseconds like krakenex does, so workers started
+# (or respawned) at different times stay in step, but never repeat or go backwards
+# within the process when several calls land in the same millisecond.
+_last_nonce = 0
+_NONCE_LOCK = threading.Lock()
+
+# '/0/private/AddOrder' -> b'/0/private/AddOrder'; the handful of endpoints we sign for
+_URLPATH_BYTES: dict[str, bytes] = {}
+
+class KrakenClient(krakenex.API):
+    def __init__(self, key='', secret=''):
+        super().__init__(key, secret)
+        # one pooled keep-alive session shared by every Ticker/AddOrder call in the process,
+        # so only the first request pays the TCP+TLS handshake to api.kraken.com
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        self.session.headers.update({"Connection": "keep-alive", "Keep-Alive": "timeout=90, max=1000"})
+        self._secret_cache = (None, b'')
+
+    def _nonce(self):
+        global _last_nonce
+        with _NONCE_LOCK:
+            _last_nonce = max(_last_nonce + 1, time.time_ns() // 1_000_000)
+            return _last_nonce
+
+    def _secret_bytes(self) -> bytes:
+        # base64-decode the API secret once, redoing it only if load_key() swaps the secret
+        src, decoded = self._secret_cache
+        if src is not self.secret:
+            decoded = base64.b64decode(self.secret)
+            self._secret_cache = (self.secret, decoded)
+        return decoded
+
+    def query_private(self, method, data=None, timeout=None):
+        # krakenex urlencodes the form to sign it and requests encodes it again for the body;
+        # encode one ('nonce', ...), *params tuple and post exactly the string that was signed
+        if not self.key or not self.secret:
+            raise Exception('Either key or secret is not set! (Use `load_key()`.')
+        nonce = self._nonce()
+        postdata = urllib.parse.urlencode((('nonce', nonce), *(data or {}).items()), doseq=False)
+        urlpath = '/' + self.apiversion + '/private/' + method
+        headers = {
+            'API-Key': self.key,
+            'API-Sign': self._sign_postdata(nonce, postdata, urlpath),
+            'Content-Type': 'application/x-www-form-urlencoded',
+        }
+        return self._query(urlpath, postdata, headers, timeout=timeout)
+
+    def _sign(self, data, urlpath):
+        return self._sign_postdata(data['nonce'], urllib.parse.urlencode(data), urlpath)
+
+    def _sign_postdata(self, nonce, postdata, urlpath):
+        # same message as krakenex.API._sign, minus the per-call secret decode / path encode
+        path = _URLPATH_BYTES.get(urlpath)
+        if path is None:
+            path = _URLPATH_BYTES[urlpath] = urlpath.encode()
+        encoded = (str(nonce) + postdata).encode()
+        message = path + hashlib.sha256(encoded).digest()
+        signature = hmac.new(self._secret_bytes(), message, hashlib.sha512)
+        return base64.b64encode(signature.digest()).decode()
@@ -0,0 +1,32 @@
+import unittest
+
+from webhook import order_volume
+
+
+class OrderVolumeTest(unittest.TestCase):
+    def test_truncates_to_8_decimals(self):
+        # 10 / 3000 = 0.0033333333..., must round down, not to nearest
+        self.assertEqual(order_volume(10, "3000"), "0.00333333")
+        self.assertEqual(order_volume(25, "3000"), "0.00833333")
+
+    def test_trailing_zero_price(self):
+        self.assertEqual(order_volume(10, "65432.10000"), "0.00015283")
+        self.assertEqual(order_volume(10, "65432.1"), "0.00015283")
+
+    def test_fractional_amount_and_price(self):
+        self.assertEqual(order_volume(100.5, "0.12345"), "814.09477521")
+        self.assertEqual(order_volume(1_000_000, "1.0"), "1000000.00000000")
+
+    def test_rejects_bad_amount(self):
+        for amount in (0, -5, float("nan"), float("inf"), 1e305):
+            with self.assertRaises(ValueError):
+                order_volume(amount, "100")
+
+    def test_rejects_bad_price(self):
+        for price in ("0", "0.000", "-100", "", "abc"):
+            with self.assertRaises(ValueError):
+                order_volume(10, price)
+
+
+if __name__ == "__main__":
+    unittest.main()
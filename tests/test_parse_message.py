@@ -0,0 +1,65 @@
+import unittest
+
+from webhook import parse_message
+
+
+def alert(symbol, action, amount):
+    return {"symbol": symbol, "action": action, "amount": amount}
+
+
+class ParseMessageTest(unittest.TestCase):
+    # expected values are what the original split-on-';'-then-':' parser returned
+
+    def test_string_alert(self):
+        self.assertEqual(parse_message("symbol: BTC-USD; action: buy; amount: 10"),
+                         alert("BTC-USD", "buy", 10.0))
+        self.assertEqual(parse_message(" Symbol:ETH/USD;action : sell ;amount:  5.5 ;"),
+                         alert("ETH/USD", "sell", 5.5))
+
+    def test_value_keeps_later_colons(self):
+        self.assertEqual(parse_message("symbol: BTC:USD; action: buy; amount: 10"),
+                         alert("BTC:USD", "buy", 10.0))
+
+    def test_empty_values_are_rejected(self):
+        self.assertIsNone(parse_message("symbol: BTC; action: ; amount: 10"))
+        self.assertIsNone(parse_message("symbol: ; action: buy; amount: 10"))
+        self.assertIsNone(parse_message("symbol: BTC; action: buy; amount:"))
+
+    def test_prefixed_keys_do_not_shadow(self):
+        self.assertEqual(parse_message("symbol: BTCUSD; action: buy; amount: 10; max-amount: 5000"),
+                         alert("BTCUSD", "buy", 10.0))
+        self.assertEqual(parse_message("symbol: BTCUSD; action: buy; amount: 10; prev-action: sell"),
+                         alert("BTCUSD", "buy", 10.0))
+        self.assertEqual(parse_message("symbol: BTCUSD; action: buy; amount: 10; last-symbol: ETHUSD"),
+                         alert("BTCUSD", "buy", 10.0))
+        self.assertIsNone(parse_message("x symbol: ETHUSD; action: buy; amount: 10"))
+
+    def test_repeated_keys_last_wins(self):
+        self.assertEqual(parse_message("symbol: BTCUSD; action: buy; amount: 10; amount: 20"),
+                         alert("BTCUSD", "buy", 20.0))
+        self.assertIsNone(parse_message("symbol: BTCUSD; action: buy; action: ; amount: 10"))
+
+    def test_newlines(self):
+        self.assertEqual(parse_message("symbol: BTCUSD;\naction: buy;\namount: 10\n"),
+                         alert("BTCUSD", "buy", 10.0))
+        # newlines alone don't separate fields
+        self.assertIsNone(parse_message("symbol: BTCUSD\naction: buy\namount: 10"))
+
+    def test_junk_fields_are_ignored(self):
+        self.assertEqual(parse_message("symbol: BTCUSD; junk; action: buy; amount: 10"),
+                         alert("BTCUSD", "buy", 10.0))
+        self.assertIsNone(parse_message("symbol: BTCUSD; action: buy; amount: ten"))
+
+    def test_message_json_shape(self):
+        self.assertEqual(parse_message({"message": "symbol: BTC-USD; action: buy; amount: 10"}),
+                         alert("BTC-USD", "buy", 10.0))
+        self.assertIsNone(parse_message({"message": 42}))
+
+    def test_dict_shape(self):
+        self.assertEqual(parse_message({"symbol": "BTCUSD", "action": "BUY", "amount": "10"}),
+                         alert("BTCUSD", "buy", 10.0))
+        self.assertIsNone(parse_message({"symbol": "BTCUSD", "action": "buy", "amount": "ten"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
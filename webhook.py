@@ -1,31 +1,111 @@
 # webhook.py
 import os
+import re
+import sys
+import hmac
+import math
+import time
 import logging
-from decimal import Decimal, ROUND_DOWN
+import functools
+import threading
 from flask import Flask, request, jsonify
-import krakenex
+from flask.json.provider import JSONProvider
+import orjson
+import msgspec
+
+class ORJSONProvider(JSONProvider):
+    # orjson for jsonify()/request JSON; Kraken results are plain JSON so no fallbacks needed
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
-logging.basicConfig(level=logging.INFO)
+app.json = ORJSONProvider(app)
+def _log_level(value: str):
+    # "debug"/"INFO" or a numeric level like "10"; None if unrecognised
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    level = logging.getLevelName(value.upper())
+    return level if isinstance(level, int) else None
+
+_LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+_level = _log_level(_LOG_LEVEL)
+logging.basicConfig(level=logging.INFO if _level is None else _level)
+logger = logging.getLogger(__name__)
+if _level is None:
+    # a typo in the env var shouldn't stop every worker from booting
+    logger.warning("Unknown LOG_LEVEL %r, using INFO", _LOG_LEVEL)
 
 # Env vars (set these on Render)
 KRAKEN_API_KEY = os.getenv("KRAKEN_API_KEY")
 KRAKEN_API_SECRET = os.getenv("KRAKEN_API_SECRET")
 WEBHOOK_TOKEN = os.getenv("WEBHOOK_TOKEN")  # Bearer token expected in TradingView header
+EXPECTED_AUTH = f"Bearer {WEBHOOK_TOKEN}".encode() if WEBHOOK_TOKEN else None
 DEFAULT_PAIR = os.getenv("DEFAULT_PAIR", "BTCUSD")  # Kraken pair fallback
+KRAKEN_TIMEOUT = float(os.getenv("KRAKEN_TIMEOUT", "10"))  # seconds per Kraken HTTP call
+PRICE_CACHE_TTL_SEC = float(os.getenv("PRICE_CACHE_TTL_SEC", "1.0"))  # 0 disables the ticker cache
+RATE_LIMIT_SECONDS = float(os.getenv("RATE_LIMIT_SECONDS", "0"))  # min gap between webhooks per worker, 0 = off
 
-kraken = krakenex.API()
-if KRAKEN_API_KEY and KRAKEN_API_SECRET:
-    kraken.key = KRAKEN_API_KEY
-    kraken.secret = KRAKEN_API_SECRET
+# monotonic time of the last accepted webhook in this process; read-modify-write only
+# under _rate_lock. Not shared between workers, so gunicorn_conf.py runs one when enabled.
+_last_hit = 0.0
+_rate_lock = threading.Lock()
+
+@functools.cache
+def get_kraken():
+    from kraken_client import KrakenClient
+    return KrakenClient(KRAKEN_API_KEY or '', KRAKEN_API_SECRET or '')
+
+def warm_kraken():
+    # open the TLS session ahead of the first alert so it doesn't pay for the handshake
+    try:
+        get_kraken().query_public('Time', timeout=5)
+    except Exception:
+        logger.warning("Kraken pre-warm failed", exc_info=True)
+
+_SEP_TBL = str.maketrans('', '', '-_/')
+# raw alert symbol -> Kraken pair; alerts use a handful of symbols, bounded anyway
+_PAIR_CACHE: dict[str, str] = {}
+_PAIR_CACHE_MAX = 256
 
 def normalize_pair(symbol: str) -> str:
     if not symbol:
         return DEFAULT_PAIR
-    p = symbol.upper().replace('-', '').replace('_', '').replace('/', '')
-    p = p.replace('BTC', 'XBT')
+    hit = _PAIR_CACHE.get(symbol)
+    if hit:
+        return hit
+    p = symbol.upper().translate(_SEP_TBL).replace('BTC', 'XBT')
+    if len(_PAIR_CACHE) < _PAIR_CACHE_MAX:
+        _PAIR_CACHE[symbol] = p
     return p
 
+class Alert(msgspec.Struct):
+    symbol: str
+    action: str
+    amount: float
+
+# strict=False so TradingView's quoted amounts ("amount": "10") still decode to float
+_ALERT_DECODER = msgspec.json.Decoder(Alert, strict=False)
+
+def decode_alert(raw: bytes):
+    # Fast path for the JSON {symbol, action, amount} body; None means use parse_message
+    try:
+        alert = _ALERT_DECODER.decode(raw)
+    except msgspec.DecodeError:
+        return None
+    if not (alert.symbol and alert.action):
+        return None
+    return {"symbol": alert.symbol, "action": alert.action.lower(), "amount": alert.amount}
+
+# one "key: value" field of the string alert format. Anchored to the start of a
+# ';'-separated field and the key is everything before the first ':', the same as
+# splitting on ';' then ':' and stripping both sides, so "max-amount: 5000" is key
+# "max-amount" (not "amount") and an empty "action: ;" gives '' and stays rejected.
+_KV_RE = re.compile(r'(?:^|;)\s*([^:;]*?)\s*:\s*([^;]*?)\s*(?=;|$)')
+
 def parse_message(payload):
     # Accept JSON {symbol, action, amount} or string "symbol: BTC-USD; action: buy; amount: 10"
     if isinstance(payload, dict):
@@ -46,12 +126,7 @@ def parse_message(payload):
     if not msg:
         return None
 
-    parts = [p.strip() for p in msg.split(';') if p.strip()]
-    data = {}
-    for part in parts:
-        if ':' in part:
-            k, v = part.split(':', 1)
-            data[k.strip().lower()] = v.strip()
+    data = {m.group(1).lower(): m.group(2) for m in _KV_RE.finditer(msg)}
     symbol = data.get('symbol')
     action = data.get('action')
     amount = data.get('amount')
@@ -62,26 +137,125 @@ def parse_message(payload):
     except:
         return None
 
-def get_last_price(pair: str) -> float:
-    res = kraken.query_public('Ticker', {'pair': pair})
+# pair -> (price, expiry on the monotonic clock), so bursts of alerts skip the Ticker call
+_PRICE_CACHE: dict[str, tuple[str, float]] = {}
+# pair -> Ticker call in progress; concurrent misses for a pair wait on it instead of
+# each issuing their own request
+_PRICE_INFLIGHT: dict[str, "_TickerFlight"] = {}
+_PRICE_LOCK = threading.Lock()
+
+class _TickerFlight:
+    __slots__ = ("done", "price", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.price = None
+        self.error = None
+
+def fetch_ticker_price(pair: str) -> str:
+    res = get_kraken().query_public('Ticker', {'pair': pair}, timeout=KRAKEN_TIMEOUT)
     if res.get('error'):
         raise Exception("Kraken API error: " + str(res['error']))
     result = res.get('result')
     if not result:
         raise Exception("No ticker result for pair " + pair)
-    key = list(result.keys())[0]
-    last = result[key]['c'][0]
-    return float(last)
-
-def place_market_order(pair: str, action: str, volume: float):
-    order_type = 'buy' if action == 'buy' else 'sell'
-    params = {
-        'pair': pair,
-        'type': order_type,
-        'ordertype': 'market',
-        'volume': str(Decimal(volume).quantize(Decimal('0.00000001'), rounding=ROUND_DOWN))
-    }
-    return kraken.query_private('AddOrder', params)
+    key = next(iter(result))
+    # keep Kraken's decimal string as-is; order_volume() does exact integer math on it
+    return result[key]['c'][0]
+
+def _is_gevent_timeout(e: BaseException) -> bool:
+    # only look gevent up if the worker already loaded it
+    gevent_timeout = sys.modules.get("gevent.timeout")
+    return gevent_timeout is not None and isinstance(e, gevent_timeout.Timeout)
+
+def get_last_price(pair: str) -> str:
+    with _PRICE_LOCK:
+        hit = _PRICE_CACHE.get(pair)
+        if hit and time.monotonic() < hit[1]:
+            return hit[0]
+        flight = _PRICE_INFLIGHT.get(pair)
+        leader = flight is None
+        if leader:
+            flight = _PRICE_INFLIGHT[pair] = _TickerFlight()
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.price
+
+    try:
+        flight.price = fetch_ticker_price(pair)
+    except Exception as e:
+        flight.error = e
+        raise
+    except BaseException as e:
+        # GreenletExit/KeyboardInterrupt/SystemExit are aimed at the leader only; waiters get
+        # an ordinary error so their handlers still answer with price_fetch_failed
+        if _is_gevent_timeout(e):
+            flight.error = TimeoutError("ticker lookup timed out")
+        else:
+            flight.error = RuntimeError("ticker lookup aborted")
+        raise
+    finally:
+        with _PRICE_LOCK:
+            del _PRICE_INFLIGHT[pair]
+            if flight.error is None and PRICE_CACHE_TTL_SEC > 0:
+                _PRICE_CACHE[pair] = (flight.price, time.monotonic() + PRICE_CACHE_TTL_SEC)
+        flight.done.set()
+    return flight.price
+
+def order_volume(usd_amount: float, price: str) -> str:
+    # usd_amount / price truncated (ROUND_DOWN) to Kraken's 8 decimals, in integer satoshis:
+    # price "65432.1" is 654321 / 10**1, usd_amount is carried as usd * 10**8
+    # usd_amount * 10**8 must stay finite too, or round() below raises OverflowError
+    if not (math.isfinite(usd_amount * 10**8) and usd_amount > 0):
+        raise ValueError("amount must be a positive finite number, got %r" % usd_amount)
+    whole, _, frac = price.partition('.')
+    price_units = int(whole + frac)
+    if price_units <= 0:
+        raise ValueError("price must be positive, got %r" % price)
+    usd_units = round(usd_amount * 10**8)
+    sats = usd_units * 10**len(frac) // price_units
+    return f"{sats // 10**8}.{sats % 10**8:08d}"
+
+# AddOrder body with every key pre-sized; copied and filled in per order
+_ORDER_TEMPLATE = {'ordertype': 'market', 'pair': '', 'type': '', 'volume': ''}
+
+class OrderOutcomeUnknown(Exception):
+    """AddOrder left the process but no usable reply came back; the order may have filled."""
+
+def _order_reached_kraken(e) -> bool:
+    # Conservative: only failures that happen before the request is sent mean "not placed"
+    from requests import exceptions as rex
+    from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+    if isinstance(e, rex.JSONDecodeError):
+        return True  # a response arrived but couldn't be read
+    if isinstance(e, rex.HTTPError):
+        return e.response is None or e.response.status_code >= 500
+    if isinstance(e, rex.ConnectTimeout):
+        return False
+    if isinstance(e, rex.ConnectionError):
+        # a fresh connection that never opened (DNS, refused, connect timeout) sent nothing;
+        # a dropped keep-alive connection, reset or protocol error may have sent the body
+        cause = e.args[0] if e.args else None
+        return not (isinstance(cause, MaxRetryError) and isinstance(cause.reason, ConnectTimeoutError))
+    if isinstance(e, ValueError):
+        return False  # InvalidURL, MissingSchema, ...: rejected while preparing the request
+    return True  # ReadTimeout, ChunkedEncodingError, ContentDecodingError, ...
+
+def place_market_order(pair: str, action: str, volume: str):
+    from requests.exceptions import RequestException
+    params = _ORDER_TEMPLATE.copy()
+    params['pair'] = pair
+    params['type'] = 'buy' if action == 'buy' else 'sell'
+    params['volume'] = volume
+    try:
+        return get_kraken().query_private('AddOrder', params, timeout=KRAKEN_TIMEOUT)
+    except RequestException as e:
+        if _order_reached_kraken(e):
+            raise OrderOutcomeUnknown(str(e)) from e
+        raise
 
 @app.route("/", methods=["GET"])
 def root():
@@ -93,47 +267,71 @@ def health():
 
 @app.route("/webhook", methods=["POST"])
 def webhook():
-    # Authorization header check (TradingView -> custom header)
-    auth = request.headers.get('Authorization', '')
-    if WEBHOOK_TOKEN:
-        expected = f"Bearer {WEBHOOK_TOKEN}"
-        if auth != expected:
-            logging.warning("Unauthorized request: headers=%s", dict(request.headers))
+    global _last_hit
+    # Authorization header check (TradingView -> custom header), before the body is touched;
+    # constant-time compare so the token can't be recovered from response timings
+    if EXPECTED_AUTH:
+        auth = request.environ.get('HTTP_AUTHORIZATION', '')
+        if not hmac.compare_digest(auth.encode(), EXPECTED_AUTH):
+            logger.warning("Unauthorized request from %s", request.remote_addr)
             return jsonify({"status":"error","message":"unauthorized"}), 401
 
-    # load JSON if possible, else raw body
-    payload = None
-    try:
-        payload = request.get_json(force=True, silent=True) or request.data.decode('utf-8')
-    except:
-        payload = request.data.decode('utf-8') if request.data else None
+    if RATE_LIMIT_SECONDS > 0:
+        with _rate_lock:
+            now = time.monotonic()
+            limited = now - _last_hit < RATE_LIMIT_SECONDS
+            if not limited:
+                _last_hit = now
+        if limited:
+            logger.warning("Rate limited: less than %ss since last webhook", RATE_LIMIT_SECONDS)
+            return jsonify({"status":"error","message":"rate_limited"}), 429
 
-    parsed = parse_message(payload)
+    # read the body once; everything below works from this buffer
+    raw = request.get_data(cache=False)
+    parsed = decode_alert(raw)
     if not parsed:
-        logging.error("Invalid payload: %s", payload)
+        # legacy shapes: {"message": "..."} JSON or the "symbol: ...; action: ..." string
+        try:
+            payload = orjson.loads(raw) or raw.decode('utf-8', 'replace')
+        except orjson.JSONDecodeError:
+            payload = raw.decode('utf-8', 'replace') if raw else None
+        parsed = parse_message(payload)
+    if not parsed:
+        logger.error("Invalid payload: %s", payload)
         return jsonify({"status":"error","message":"invalid payload"}), 400
 
     symbol = normalize_pair(parsed['symbol'])
     action = parsed['action']
     usd_amount = float(parsed['amount'])
-    logging.info("Parsed: symbol=%s action=%s usd_amount=%s", symbol, action, usd_amount)
+    logger.debug("Parsed: symbol=%s action=%s usd_amount=%s", symbol, action, usd_amount)
+    if not (math.isfinite(usd_amount * 10**8) and usd_amount > 0):
+        logger.error("Invalid amount: %s", usd_amount)
+        return jsonify({"status":"error","message":"invalid amount"}), 400
 
     try:
         price = get_last_price(symbol)
     except Exception as e:
-        logging.exception("Price fetch failed")
+        logger.exception("Price fetch failed")
         return jsonify({"status":"error","message":"price_fetch_failed","error":str(e)}), 500
 
-    volume = usd_amount / price
-    volume = float(Decimal(volume).quantize(Decimal('0.00000001'), rounding=ROUND_DOWN))
+    try:
+        volume = order_volume(usd_amount, price)
+    except ValueError as e:
+        logger.exception("Volume calculation failed for price=%s", price)
+        return jsonify({"status":"error","message":"volume_calc_failed","error":str(e)}), 500
 
-    logging.info("Placing market order pair=%s type=%s volume=%s price=%s", symbol, action, volume, price)
+    logger.info("Placing market order pair=%s type=%s volume=%s price=%s", symbol, action, volume, price)
     try:
         result = place_market_order(symbol, action, volume)
-        logging.info("Order result: %s", result)
+        logger.info("Order result: %s", result)
         return jsonify({"status":"success","order_result":result}), 200
+    except OrderOutcomeUnknown as e:
+        # AddOrder was sent but the reply was lost; it may well have filled,
+        # so don't claim it failed (a retry could double the position)
+        logger.exception("Order outcome unknown")
+        return jsonify({"status":"unknown","message":"order_outcome_unknown","error":str(e)}), 504
     except Exception as e:
-        logging.exception("Order failed")
+        logger.exception("Order failed")
         return jsonify({"status":"error","message":"order_failed","error":str(e)}), 500
 
 if __name__ == "__main__":